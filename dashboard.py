@@ -1,6 +1,12 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
+import polars as pl
 import numpy as np
+import pyarrow as pa
 import pydeck as pdk
 import plotly.express as px
 
@@ -10,6 +16,58 @@ import helper as help
 
 
 
+PAGE_SIZE = 2000
+MAX_WORKERS = 8
+
+# Only the columns used by the dashboard are requested, with the smallest types holding the data
+SCHEMA = pa.schema([
+    ("crash_date", pa.string()),
+    ("crash_time", pa.string()),
+    ("latitude", pa.float32()),
+    ("longitude", pa.float32()),
+    ("on_street_name", pa.string()),
+    ("number_of_persons_injured", pa.int16()),
+    ("number_of_pedestrians_injured", pa.int16()),
+    ("number_of_cyclist_injured", pa.int16()),
+    ("number_of_motorist_injured", pa.int16()),
+    ("number_of_persons_killed", pa.int16()),
+    ("number_of_pedestrians_killed", pa.int16()),
+    ("number_of_cyclist_killed", pa.int16()),
+    ("number_of_motorist_killed", pa.int16()),
+])
+SELECT_COLUMNS = ", ".join(SCHEMA.names)
+# Keep missing counts as nullable integers when converting to pandas
+PANDAS_TYPES = {pa.int16(): pd.Int16Dtype()}
+# Include the data only from NYC metro area
+NYC_LATITUDE_MIN, NYC_LATITUDE_MAX = 40.4, 41.0
+NYC_LONGITUDE_MIN, NYC_LONGITUDE_MAX = -74.3, -73.7
+WHERE_NYC = ("latitude IS NOT NULL AND longitude IS NOT NULL "
+             "AND latitude between %s and %s AND longitude between %s and %s"
+             % (NYC_LATITUDE_MIN, NYC_LATITUDE_MAX, NYC_LONGITUDE_MIN, NYC_LONGITUDE_MAX))
+
+
+def fetch_page(offset: int, limit: int) -> list:
+    '''
+    This function fetches a single page of records through SODA API
+    ...
+    var offset: Index of the first record of the page
+    type: int
+
+    var limit: Number of records in the page
+    type: int
+    ...
+    return: A list with the records of the page
+    rtype: list
+    '''
+    # A client per page, since the underlying requests session is not thread-safe
+    client = Socrata("data.cityofnewyork.us", None)
+    client.timeout = 1000
+    try:
+        return client.get("h9gi-nx95", select=SELECT_COLUMNS, where=WHERE_NYC, limit=limit, offset=offset, order=":id")
+    finally:
+        client.close()
+
+
 @st.cache_data(persist=True)
 def load_data(nrows: int) -> pd.DataFrame:
     '''
@@ -21,13 +79,19 @@ def load_data(nrows: int) -> pd.DataFrame:
     return: A dataframe with the data on several incidents in NYC
     rtype: pd.DataFrame
     '''
-    client = Socrata("data.cityofnewyork.us", None)
-    client.timeout = 1000
-    results = client.get("h9gi-nx95", limit=nrows)
-    df = pd.DataFrame.from_records(results)
+    # Split the request into pages and fetch them in parallel
+    pages = [(offset, min(PAGE_SIZE, nrows - offset)) for offset in range(0, nrows, PAGE_SIZE)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda page: fetch_page(*page), pages))
+    # SODA returns every value as a string: build the columns in Arrow and convert them there in one go
+    records = list(itertools.chain.from_iterable(results))
+    table = pa.Table.from_pylist(records, schema=pa.schema([(name, pa.string()) for name in SCHEMA.names]))
+    table = table.cast(SCHEMA)
+    df = table.to_pandas(types_mapper=PANDAS_TYPES.get)
     return df
 
 
+@st.cache_data(persist=True)
 def scrub_data(df: pd.DataFrame) -> pd.DataFrame:
     '''
     This function cleans the dataset before analyzing it
@@ -38,35 +102,40 @@ def scrub_data(df: pd.DataFrame) -> pd.DataFrame:
     return: Processed dataframe with the data on several incidents
     rtype: pd.DataFrame
     '''
+    # Rename Columns
+    lf = pl.from_pandas(df).lazy().rename({col: str(col).lower().replace(' ', '_') for col in df.columns})
+
     # Parse Date and Time
-    df['crash_date'] = pd.to_datetime(df['crash_date']).dt.strftime('%Y-%m-%d') 
-    df['crash_time'] = pd.to_datetime(df['crash_time'], format='%H:%M').dt.time
-    df['crash_date_crash_time'] = pd.to_datetime(df['crash_date'].astype(str) + ' ' + df['crash_time'].astype(str), format = '%Y-%m-%d %H:%M:%S')
-
-    # Drop superfluous data and Rename Columns
-    df.dropna(subset=['latitude', 'longitude'], inplace=True)
-    lowercase = lambda x: str(x).lower()
-    df.rename(lowercase, axis="columns", inplace=True)
-    df.columns = df.columns.str.replace(' ', '_')
-    df.rename(columns={"crash_date_crash_time": "date/time"}, inplace=True)
-
-    # Convert strings to numerical data
-    numeric_data = (['number_of_persons_injured', 'number_of_pedestrians_injured', 'number_of_cyclist_injured', 'number_of_motorist_injured',
-                     'number_of_persons_killed', 'number_of_pedestrians_killed', 'number_of_cyclist_killed', 'number_of_motorist_killed'])
-    df[numeric_data] = df[numeric_data].apply(pd.to_numeric, errors='coerce')
-    df['latitude'] = df['latitude'].astype(float)
-    df['longitude'] = df['longitude'].astype(float)
-
-    # Include the data only from NYC metro area
-    nyc_latitude_min = 40.4
-    nyc_latitude_max = 41.0
-    nyc_longitude_min = -74.3
-    nyc_longitude_max = -73.7
-    df = (df[(df['latitude'] >= nyc_latitude_min) & (df['latitude'] <= nyc_latitude_max) &
-                (df['longitude'] >= nyc_longitude_min) & (df['longitude'] <= nyc_longitude_max)])
-    return df
+    lf = lf.with_columns(pl.col('crash_date').str.to_datetime('%Y-%m-%dT%H:%M:%S%.f'))
+    lf = lf.with_columns(pl.col('crash_date').dt.combine(pl.col('crash_time').str.to_time('%H:%M')).alias('date/time'))
+    lf = lf.with_columns(
+        # Helper columns for the time filters, prefixed with '_' to keep them out of the displayed data
+        pl.col('date/time').dt.hour().cast(pl.Int8).alias('_hour'),
+        pl.col('date/time').dt.minute().cast(pl.Int8).alias('_minute'),
+        # Store the street names as integer codes into a single dictionary of names
+        pl.col('on_street_name').cast(pl.Categorical),
+    )
+
+    # Include the data only from NYC metro area (already done by the query, kept in case it is bypassed)
+    lf = lf.filter(pl.col('latitude').is_between(NYC_LATITUDE_MIN, NYC_LATITUDE_MAX) &
+                   pl.col('longitude').is_between(NYC_LONGITUDE_MIN, NYC_LONGITUDE_MAX))
+    return lf.collect().to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+# Column holding the count for each type of incident
+INCIDENT_COLUMNS = {
+    'Total Injured': 'number_of_persons_injured',
+    'Pedestrians Injured': 'number_of_pedestrians_injured',
+    'Cyclists Injured': 'number_of_cyclist_injured',
+    'Motorists Injured': 'number_of_motorist_injured',
+    'Total Killed': 'number_of_persons_killed',
+    'Pedestrians Killed': 'number_of_pedestrians_killed',
+    'Cyclists Killed': 'number_of_cyclist_killed',
+    'Motorists Killed': 'number_of_motorist_killed',
+}
 
 
+@st.fragment
 def map_of_the_incident(df: pd.DataFrame) -> None:
     '''
     This function plots the data points of the incident on the map and proides options to view raw data and analyze it
@@ -79,27 +148,12 @@ def map_of_the_incident(df: pd.DataFrame) -> None:
     '''
     
     st.header("Visualize data based on the type of incident")
-    select = st.selectbox('', (['Total Injured', 'Pedestrians Injured', 'Cyclists Injured', 'Motorists Injured', 
-                               'Total Killed', 'Pedestrians Killed', 'Cyclists Killed', 'Motorists Killed']))
+    select = st.selectbox('', list(INCIDENT_COLUMNS))
    
     # Extract the data
     num_people = st.slider("Number of persons injured in vehicle collisions", min_value=0, max_value=15, value=1)
-    if select == 'Total Injured':
-        query_data = df.query("number_of_persons_injured >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Pedestrians Injured':
-        query_data = df.query("number_of_pedestrians_injured >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Cyclists Injured':
-        query_data = df.query("number_of_cyclist_injured >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Motorists Injured':
-        query_data = df.query("number_of_motorist_injured >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Total Killed':
-        query_data = df.query("number_of_persons_killed >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Pedestrians Killed':
-        query_data = df.query("number_of_pedestrians_killed >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Cyclists Killed':
-        query_data = df.query("number_of_cyclist_killed >= @num_people")[["latitude", "longitude"]].dropna(how="any")
-    elif select == 'Motorists Killed':
-        query_data = df.query("number_of_motorist_killed >= @num_people")[["latitude", "longitude"]].dropna(how="any")
+    # Coordinates are never missing after the server-side filter, so no dropna is needed
+    query_data = df.loc[df[INCIDENT_COLUMNS[select]] >= num_people, ["latitude", "longitude"]]
 
     # Plot the map
     st.map(query_data, zoom=12)
@@ -107,7 +161,7 @@ def map_of_the_incident(df: pd.DataFrame) -> None:
     # Raw data check-box for this map
     if st.checkbox("Show raw data", value=False, key=1.1):
         st.subheader("Raw data of " + "'" + str(select) + "'")
-        st.write(df)
+        st.write(help.drop_helper_columns(df))
 
     # Analysis check-box for the data selected for this map
     if st.checkbox("Analyze the data for " + "'" + str(select) + "'", value=True, key=1.2):
@@ -128,14 +182,17 @@ def map_of_the_incident_freq_hist(df: pd.DataFrame) -> int:
     
     st.header("How many collisions occur during a given time of day? (24-hour clock)")
     hour = st.slider("Hour to look at", min_value=0, max_value=23, value=17)
-    df = df[df["date/time"].dt.hour == hour]
+    df = df[df["_hour"] == hour]
     st.markdown("Vehicle collisions between %i:00 and %i:00" % (hour, (hour + 1) % 24))
     # New York City coordinates
     latitude, longitude = 40.7128, -74.0060
     midpoint = (latitude, longitude) # Point the initial view of the map to New york city
+    # Only the positions are needed, sent as compact [longitude, latitude] pairs (5 decimals is ~1 m)
+    coords = np.round(df[['longitude', 'latitude']].to_numpy(dtype=np.float64), 5).tolist()
     # Map customization: centering and area
-    st.write(pdk.Deck(
-        map_style="mapbox://styles/mapbox/streets-v12", # mapbox://styles/mapbox/light-v9
+    deck = pdk.Deck(
+        map_provider="carto", # The HTML embed has no Mapbox token, so use a Carto basemap
+        map_style=pdk.map_styles.ROAD,
         initial_view_state={
             "latitude": midpoint[0],
             "longitude": midpoint[1],
@@ -145,8 +202,8 @@ def map_of_the_incident_freq_hist(df: pd.DataFrame) -> int:
         layers=[
             pdk.Layer(
             "HexagonLayer",
-            data=df[['date/time', 'latitude', 'longitude']],
-            get_position=["longitude", "latitude"],
+            data=coords,
+            get_position="-",
             auto_highlight=True,
             radius=100,
             extruded=True,
@@ -155,11 +212,13 @@ def map_of_the_incident_freq_hist(df: pd.DataFrame) -> int:
             elevation_range=[0, 1000],
             ),
         ],
-    ))
+    )
+    # Embed the deck as plain HTML rather than through the Streamlit pydeck bridge
+    components.html(deck.to_html(as_string=True), height=600)
     # Raw data check-box for this map
     if st.checkbox("Show raw data", value=False, key=2):
         st.subheader("Raw data by minute between %i:00 and %i:00" % (hour, (hour + 1) % 24))
-        st.write(df)
+        st.write(help.drop_helper_columns(df))
     return hour
 
 
@@ -178,15 +237,42 @@ def gen_chart_hist_by_min(df: pd.DataFrame, hour) -> None:
     '''
 
     st.subheader("Breakdown by minute between %i:00 and %i:00" % (hour, (hour + 1) % 24))
-    filtered = df[
-        (df["date/time"].dt.hour >= hour) & (df["date/time"].dt.hour < (hour + 1))
-    ]
-    hist = np.histogram(filtered["date/time"].dt.minute, bins=60, range=(0, 60))[0]
+    minutes = df.loc[df["_hour"] == hour, "_minute"].to_numpy()
+    hist = np.bincount(minutes, minlength=60)
     chart_data = pd.DataFrame({"minute": range(60), "crashes": hist})
     fig = px.bar(chart_data, x='minute', y='crashes', hover_data=['minute', 'crashes'], height=400)
     st.write(fig)
 
 
+# Column holding the number of injured for each affected class
+AFFECTED_CLASS_COLUMNS = {
+    'Pedestrians': 'number_of_pedestrians_injured',
+    'Cyclists': 'number_of_cyclist_injured',
+    'Motorists': 'number_of_motorist_injured',
+}
+
+
+@st.cache_data
+def top_streets(df: pd.DataFrame, col: str, n: int = 5) -> pd.DataFrame:
+    '''
+    This function finds the streets with the most injured for a certain affected class
+    ...
+    var df: Data on several incidents in NYC
+    type: pd.DataFrame
+
+    var col: Column holding the number of injured for the affected class
+    type: str
+
+    var n: Number of streets to be returned
+    type: int
+    ...
+    return: Dataframe with the top n streets and the number of injured
+    rtype: pd.DataFrame
+    '''
+    return df.loc[df[col] >= 1, ["on_street_name", col]].dropna(how="any").nlargest(n, col)
+
+
+@st.fragment
 def create_table_incident_by_street(df: pd.DataFrame) -> None:
     '''
     This function creates a table for the top 5 streets for the specified incident 
@@ -199,13 +285,28 @@ def create_table_incident_by_street(df: pd.DataFrame) -> None:
     '''
 
     st.header("Top 5 dangerous streets by affected class")
-    select = st.selectbox('Affected class', ['Pedestrians', 'Cyclists', 'Motorists'])
-    if select == 'Pedestrians':
-        st.write(df.query("number_of_pedestrians_injured >= 1")[["on_street_name", "number_of_pedestrians_injured"]].sort_values(by=['number_of_pedestrians_injured'], ascending=False).dropna(how="any")[:5])
-    elif select == 'Cyclists':
-        st.write(df.query("number_of_cyclist_injured >= 1")[["on_street_name", "number_of_cyclist_injured"]].sort_values(by=['number_of_cyclist_injured'], ascending=False).dropna(how="any")[:5])
-    else:
-        st.write(df.query("number_of_motorist_injured >= 1")[["on_street_name", "number_of_motorist_injured"]].sort_values(by=['number_of_motorist_injured'], ascending=False).dropna(how="any")[:5])
+    select = st.selectbox('Affected class', list(AFFECTED_CLASS_COLUMNS))
+    st.write(top_streets(df, AFFECTED_CLASS_COLUMNS[select]))
+
+
+@st.fragment
+def collisions_by_time_of_day(df: pd.DataFrame) -> None:
+    '''
+    This function groups the hour map and the breakdown by minute, which both depend on the hour selected by user
+    ...
+    var df: Data on a certain motor incident in NYC
+    type: pd.DataFrame
+    ...
+    return: Plots the incident frequency on the map and by each minute of the selected hour
+    rtype: None
+    '''
+
+    # Map-2: Plots histograms based on frequency of the incident on the map 
+    hour = map_of_the_incident_freq_hist(df)
+    help.space(4)
+
+    # Chart: Plots histograms based on frequency of the incident by each minute in the specified time on time-axis 
+    gen_chart_hist_by_min(df, hour)
 
 
 def gen_dashboard(nrows: int) -> None:
@@ -230,6 +331,7 @@ def gen_dashboard(nrows: int) -> None:
                 "to analyze motor vehicle collisions in NYC 🗽")
     help.space(4)
 
+    # Each section below is a fragment: interacting with its widgets reruns only that section
     data = load_data(nrows)
     data = scrub_data(data)
 
@@ -237,12 +339,8 @@ def gen_dashboard(nrows: int) -> None:
     map_of_the_incident(data)
     help.space(4)
 
-    # Map-2: Plots histograms based on frequency of the incident on the map 
-    hour = map_of_the_incident_freq_hist(data)
-    help.space(4)
-
-    # Chart: Plots histograms based on frequency of the incident by each minute in the specified time on time-axis 
-    gen_chart_hist_by_min(data, hour)
+    # Map-2 and Chart: Plot the frequency of the incident on the map and by each minute in the specified time
+    collisions_by_time_of_day(data)
     help.space(4)
 
     # Table: Creates a table for the top 5 streets for the specified incident 
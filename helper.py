@@ -1,10 +1,12 @@
-import io
+import math
 import pandas as pd
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
 
-def df_info(df: pd.DataFrame) -> None:
+def df_info(df: pd.DataFrame) -> pd.DataFrame:
     '''
     This function imports a dataframe and creates a table with info on the names, 
     number of non-null values, data type of the fields
@@ -12,26 +14,12 @@ def df_info(df: pd.DataFrame) -> None:
     var df: A dataframe with the data on several incidents in NYC
     type: pd.DataFrame
     ...
-    return: Displays a table with info on the dataframe
-    rtype: None
+    return: Table with info on the dataframe
+    rtype: pd.DataFrame
     '''
 
-    buffer = io.StringIO() 
-    df.info(buf=buffer)
-    s = buffer.getvalue() 
-    df_info = s.split('\n')
-    counts = []
-    names = []
-    nn_count = []
-    dtype = []
-    for i in range(5, len(df_info)-3):
-        line = df_info[i].split()
-        counts.append(line[0])
-        names.append(line[1])
-        nn_count.append(line[2])
-        dtype.append(line[4])
-    df_info_dataframe = pd.DataFrame(data = {'#': counts, 'variable': names, 'Non-Null Count': nn_count, 'Data Type': dtype})
-    return df_info_dataframe.drop('#', axis = 1)
+    return pd.DataFrame(data = {'variable': df.columns, 'Non-Null Count': df.notna().sum().values,
+                                'Data Type': df.dtypes.astype(str).values})
 
 
 def space(num_lines: int) -> None:
@@ -44,8 +32,7 @@ def space(num_lines: int) -> None:
     return: Leaves space
     rtype: None
     '''
-    for _ in range(num_lines):
-        st.write("")
+    st.markdown("<br>" * num_lines, unsafe_allow_html = True)
 
 
 def sidebar_space(num_lines: int) -> None:
@@ -58,8 +45,7 @@ def sidebar_space(num_lines: int) -> None:
     return: Leaves space
     rtype: None
     '''
-    for _ in range(num_lines):
-        st.sidebar.write("")
+    st.sidebar.markdown("<br>" * num_lines, unsafe_allow_html = True)
 
 
 def df_isnull(df: pd.DataFrame) -> pd.DataFrame:
@@ -90,13 +76,12 @@ def number_of_outliers(df):
     rtype: pd.DataFrame
     '''
 
-    df = df.select_dtypes(exclude = 'object')
-    Q1 = df.quantile(0.25)
-    Q3 = df.quantile(0.75)
+    df = df.select_dtypes(exclude = ['object', 'category'])
+    q = df.quantile([0.25, 0.75])
+    Q1, Q3 = q.iloc[0], q.iloc[1]
     IQR = Q3 - Q1
     ans = ((df < (Q1 - 1.5 * IQR)) | (df > (Q3 + 1.5 * IQR))).sum()
-    df = pd.DataFrame(ans).reset_index().rename(columns = {'index':'variable', 0:'count_of_outliers'})
-    return df
+    return pd.DataFrame(data = {'variable': ans.index, 'count_of_outliers': ans.values})
 
 
 def multiselect_container(message, arr, key):
@@ -120,6 +105,42 @@ def multiselect_container(message, arr, key):
     return selected_num_cols    
 
 
+def subplots_grid(cols, make_trace) -> go.Figure:
+    '''
+    This function creates a single figure with one subplot per variable, laid out in two columns
+    ...
+    var cols: Names of the variables to be plotted
+    type: list
+
+    var make_trace: Function returning the plotly trace for a variable
+    type: Callable[[str], go.BaseTraceType]
+    ...
+    return: Figure with the subplots of all the variables
+    rtype: go.Figure
+    '''
+
+    rows = math.ceil(len(cols) / 2)
+    fig = make_subplots(rows = rows, cols = 2, subplot_titles = list(cols))
+    for k, col in enumerate(cols):
+        fig.add_trace(make_trace(col), row = k // 2 + 1, col = k % 2 + 1)
+    fig.update_layout(height = 450 * rows, showlegend = False)
+    return fig
+
+
+def drop_helper_columns(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    This function removes the helper columns (prefixed with '_') that are not part of the data on the incidents
+    ...
+    var df: Data on a certain motor incident in NYC
+    type: pd.DataFrame
+    ...
+    return: Dataframe without the helper columns
+    rtype: pd.DataFrame
+    '''
+
+    return df.loc[:, ~df.columns.str.startswith('_')]
+
+
 def exploratory_data_analysis(df: pd.DataFrame) -> None:
     '''
     This function performs exploratory data analysis based on the option selected by users
@@ -131,6 +152,8 @@ def exploratory_data_analysis(df: pd.DataFrame) -> None:
     rtype: None
     '''
 
+    df = drop_helper_columns(df)
+
     # List of Analysis
     all_vizuals = (['Info', 'Missing Value Info', 'Descriptive Analysis', 'Target Analysis', 
                    'Distribution of Numerical variables', 'Count Plots of Categorical variables', 
@@ -165,13 +188,13 @@ def exploratory_data_analysis(df: pd.DataFrame) -> None:
         target_column = st.selectbox("", df.columns, index = len(df.columns) - 1)
     
         st.subheader("Histogram of target variable")
-        fig = px.histogram(df, x = target_column)
+        fig = px.histogram(df[[target_column]], x = target_column)
         c1, c2, c3 = st.columns([0.5, 2, 0.5])
         c2.plotly_chart(fig)
 
     # Analysis-5: Distribution Analysis - for numerical variables in the Dataset
-    num_columns = df.select_dtypes(exclude = 'object').columns
-    cat_columns = df.select_dtypes(include = 'object').columns
+    num_columns = df.select_dtypes(exclude = ['object', 'category']).columns
+    cat_columns = df.select_dtypes(include = ['object', 'category']).columns
 
     if 'Distribution of Numerical variables' in vizuals:
 
@@ -180,16 +203,9 @@ def exploratory_data_analysis(df: pd.DataFrame) -> None:
         else:
             selected_num_cols = multiselect_container('Choose variables for Distribution plots:', num_columns, 'Distribution')
             st.subheader('Distribution of numerical variables')
-            i = 0
-            while (i < len(selected_num_cols)):
-                c1, c2 = st.columns(2)
-                for j in [c1, c2]:
-
-                    if (i >= len(selected_num_cols)):
-                        break
-                    fig = px.histogram(df, x = selected_num_cols[i])
-                    j.plotly_chart(fig, use_container_width = True)
-                    i += 1
+            if len(selected_num_cols) > 0:
+                fig = subplots_grid(selected_num_cols, lambda col: go.Histogram(x = df[col], name = col))
+                st.plotly_chart(fig, use_container_width = True)
 
     # Analysis-6: Count Plots - for non-numerical variables in the Dataset
     if 'Count Plots of Categorical variables' in vizuals:
@@ -198,17 +214,9 @@ def exploratory_data_analysis(df: pd.DataFrame) -> None:
         else:
             selected_cat_cols = multiselect_container('Choose variables for Count plots:', cat_columns, 'Count')
             st.subheader('Count plots of categorical variables')
-            i = 0
-            while (i < len(selected_cat_cols)):
-                c1, c2 = st.columns(2)
-                for j in [c1, c2]:
-
-                    if (i >= len(selected_cat_cols)):
-                        break
-
-                    fig = px.histogram(df, x = selected_cat_cols[i], color_discrete_sequence=['indianred'])
-                    j.plotly_chart(fig)
-                    i += 1
+            if len(selected_cat_cols) > 0:
+                fig = subplots_grid(selected_cat_cols, lambda col: go.Histogram(x = df[col], name = col, marker_color = 'indianred'))
+                st.plotly_chart(fig, use_container_width = True)
 
     # Analysis-7: Box plots - for numerical variables in the Dataset
     if 'Box Plots' in vizuals:
@@ -217,17 +225,9 @@ def exploratory_data_analysis(df: pd.DataFrame) -> None:
         else:
             selected_num_cols = multiselect_container('Choose variables for Box plots:', num_columns, 'Box')
             st.subheader('Box plots')
-            i = 0
-            while (i < len(selected_num_cols)):
-                c1, c2 = st.columns(2)
-                for j in [c1, c2]:
-                    
-                    if (i >= len(selected_num_cols)):
-                        break
-                    
-                    fig = px.box(df, y = selected_num_cols[i])
-                    j.plotly_chart(fig, use_container_width = True)
-                    i += 1
+            if len(selected_num_cols) > 0:
+                fig = subplots_grid(selected_num_cols, lambda col: go.Box(y = df[col], name = col))
+                st.plotly_chart(fig, use_container_width = True)
 
     # Analysis-8: Outlier Analysis - for numerical variables in the Dataset
     if 'Outlier Analysis' in vizuals: